@@ -0,0 +1,168 @@
+"""Task interface and results."""
+
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any
+
+
+class Task(ABC):
+    """
+    Base class for tasks.
+
+    Inherit from this class to create something suitable to pass into
+    taskwait.  Statuses are compared many times while waiting, so
+    `status()` should ideally return constant (or `sys.intern`-ed)
+    strings, such as the members of `status_waiting` and
+    `status_running`.
+
+    Attributes
+    ----------
+      status_waiting (set[str]):
+          A set of statuses that are interpreted as "waiting"
+      status_running (set[str]):
+        A set of statuses that are interpreted as "running"
+      changed (threading.Event | None):
+        An optional event that the task sets when its status may
+        have changed.  If given, we wait on this rather than sleeping
+        between polls, so that transitions are picked up immediately.
+
+    """
+
+    status_waiting: set[str]
+    status_running: set[str]
+    changed: threading.Event | None = None
+
+    @abstractmethod
+    def status(self) -> str:
+        """Query for the status of the task."""
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def log(self) -> list[str] | None:
+        """Fetch logs for the task, if available."""
+        return None  # pragma: no cover
+
+    def log_from(self, skip: int) -> list[str] | None:
+        """
+        Fetch logs for the task, after the first `skip` lines.
+
+        The default implementation fetches all logs with `log()` and
+        drops the lines already seen.  Override this if the backend can
+        return just the new lines.
+        """
+        value = self.log()
+        return value[skip:] if value else value
+
+    def log_etag(self) -> Any:
+        """
+        Return a token that changes whenever the logs change.
+
+        If this returns something other than `None` that is equal to
+        the value returned at the previous poll, the logs are assumed
+        to be unchanged and are not fetched.  The default returns
+        `None`, so logs are fetched on every poll.
+        """
+        return None
+
+    def completion_fd(self) -> int | None:
+        """
+        Return a file descriptor that becomes readable on completion.
+
+        If the task can provide one (for example, from `os.pidfd_open`
+        for a subprocess, or a socket) we wait for it to become
+        readable rather than sleeping between polls, so completion is
+        noticed as soon as it happens.  Once it has become readable we
+        go back to sleeping between polls, until `status()` reports
+        that the task has finished.  On Windows this must be a socket.
+        The default returns `None`, so we sleep.
+
+        This is called on every poll until the descriptor becomes
+        readable, so return the same descriptor each time rather than
+        opening a new one.  The task owns the descriptor and is
+        responsible for closing it.
+        """
+        return None
+
+    @abstractmethod
+    def has_log(self) -> bool:
+        """Indicate if this task **may** produce logs (now or in future)."""
+        pass  # pragma: no cover
+
+
+@dataclass(slots=True, frozen=True)
+class Result:
+    """
+    Result of waiting on a task.
+
+    Attributes
+    ----------
+      status (str):
+        The final status, returned by the ``status()`` method
+      start (float):
+        The task start time, in seconds since the Epoch
+      end (float):
+        The task end time, in seconds since the Epoch
+
+    """
+
+    status: str
+    start: float
+    end: float
+
+
+class AsyncTask(ABC):
+    """
+    Base class for tasks whose status and logs are fetched asynchronously.
+
+    Inherit from this class to create something suitable to pass into
+    taskwait_async.
+
+    Attributes
+    ----------
+      status_waiting (set[str]):
+          A set of statuses that are interpreted as "waiting"
+      status_running (set[str]):
+        A set of statuses that are interpreted as "running"
+
+    """
+
+    status_waiting: set[str]
+    status_running: set[str]
+
+    @abstractmethod
+    async def status(self) -> str:
+        """Query for the status of the task."""
+        pass  # pragma: no cover
+
+    @abstractmethod
+    async def log(self) -> list[str] | None:
+        """Fetch logs for the task, if available."""
+        return None  # pragma: no cover
+
+    async def log_from(self, skip: int) -> list[str] | None:
+        """
+        Fetch logs for the task, after the first `skip` lines.
+
+        The default implementation fetches all logs with `log()` and
+        drops the lines already seen.  Override this if the backend can
+        return just the new lines.
+        """
+        value = await self.log()
+        return value[skip:] if value else value
+
+    async def log_etag(self) -> Any:
+        """
+        Return a token that changes whenever the logs change.
+
+        If this returns something other than `None` that is equal to
+        the value returned at the previous poll, the logs are assumed
+        to be unchanged and are not fetched.  The default returns
+        `None`, so logs are fetched on every poll.
+        """
+        return None
+
+    @abstractmethod
+    def has_log(self) -> bool:
+        """Indicate if this task **may** produce logs (now or in future)."""
+        pass  # pragma: no cover
@@ -0,0 +1,517 @@
+"""
+Polling loops used to wait on tasks.
+
+This module has no classes intended for subclassing, so that it can
+optionally be compiled with mypyc (see the README).
+"""
+
+import asyncio
+import functools
+import itertools
+import selectors
+import sys
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Any
+
+from taskwait._task import AsyncTask, Result, Task
+
+_WAITING = 0
+_RUNNING = 1
+_FINISHED = 2
+
+
+class _RunningTaskBase:
+    def __init__(
+        self,
+        task: Task | AsyncTask,
+        *,
+        show_log: bool = True,
+        progress: bool = True,
+        poll: float = 1,
+        poll_max: float | None = None,
+        backoff: float = 1,
+        timeout: float | None = None,
+    ):
+        # Interned once here, rather than on every poll, so that a task
+        # returning interned or constant strings hits the fast path.
+        self._waiting = frozenset(map(_intern, task.status_waiting))
+        self._running = frozenset(map(_intern, task.status_running))
+        # Statuses are mapped once onto one of the integer states above,
+        # so that the polling loops compare ints rather than searching sets.
+        self._code = dict.fromkeys(self._running, _RUNNING)
+        self._code.update(dict.fromkeys(self._waiting, _WAITING))
+        self._show_log = show_log and task.has_log()
+        self._progress = progress and not self._show_log
+        self._poll = poll
+        self._poll_max = poll_max
+        self._backoff = backoff
+        self._cur_poll = poll
+        self._skip = 0
+        self._log_etag: Any = None
+        self._t0 = time.time()
+        # None, rather than any string, so that the first status a task
+        # reports is always looked up, whatever it is.
+        # Typed loosely, as are the statuses passed around below, so that
+        # a compiled build accepts the same statuses as pure Python.
+        self._status: Any = None
+        self._state = _FINISHED
+        self._last_time: float | None = None
+        # Timing of polls and the timeout uses the monotonic clock, so that
+        # adjustments to the system clock do not affect how long we wait;
+        # the wall clock is only used for the times reported in Result.
+        self._time_end = None if timeout is None else time.monotonic() + timeout
+
+    def _set_status(self, status: Any) -> int:
+        # Tasks that return constant strings give back the same object
+        # while the status is unchanged, so we can skip the lookup.
+        if status is self._status:
+            return self._state
+        if status != self._status:
+            self._cur_poll = self._poll
+        self._status = status
+        self._state = self._code.get(status, _FINISHED)
+        return self._state
+
+    def _set_skip(self, skip: int) -> None:
+        if skip != self._skip:
+            self._cur_poll = self._poll
+            self._skip = skip
+
+    def _log_unchanged(self, etag: Any) -> bool:
+        if etag is not None and etag == self._log_etag:
+            return True
+        self._log_etag = etag
+        return False
+
+    def _increase_poll(self) -> None:
+        poll = self._cur_poll * self._backoff
+        if self._poll_max is not None:
+            poll = min(poll, self._poll_max)
+        self._cur_poll = poll
+
+    def _result(self) -> Result:
+        return Result(self._status, self._t0, time.time())
+
+
+class _RunningTask(_RunningTaskBase):
+    def __init__(
+        self,
+        task: Task,
+        *,
+        show_log: bool = True,
+        progress: bool = True,
+        poll: float = 1,
+        poll_max: float | None = None,
+        backoff: float = 1,
+        timeout: float | None = None,
+    ):
+        super().__init__(
+            task,
+            show_log=show_log,
+            progress=progress,
+            poll=poll,
+            poll_max=poll_max,
+            backoff=backoff,
+            timeout=timeout,
+        )
+        self._task = task
+        # Bound once here, rather than resolved on the task every poll.
+        self._status_fn: Callable[[], Any] = task.status
+        self._log_fn = task.log_from
+        self._log_etag_fn = task.log_etag
+        self._completion_fd_fn = task.completion_fd
+        self._fd_fired = False
+
+    def wait(self) -> Result:
+        # Check the status straight away, and start the poll period
+        # from here, so that we sleep before the next check rather than
+        # immediately asking again.
+        self._last_time = time.monotonic()
+        self._set_status(self._status_fn())
+        if self._state == _FINISHED:
+            # Already complete, so there is no need to set up progress.
+            self._show_new_log()
+            return self._result()
+        self._wait_to_start()
+        self._wait_to_finish()
+        return self._result()
+
+    def _wait_to_start(self) -> None:
+        display = self._show_log or self._progress
+        # Bind everything used in the loop to locals, saving
+        # attribute lookups on every poll.
+        set_status = self._set_status
+        task_status = self._task_status
+        state = self._state
+        with _very_simple_progress("Waiting", display=display) as p:
+            while state == _WAITING:
+                p()
+                state = set_status(task_status())
+
+    def _wait_to_finish(self) -> None:
+        set_status = self._set_status
+        task_status = self._task_status
+        show_new_log = self._show_new_log
+        state = self._state
+        with _very_simple_progress("Running", display=self._progress) as p:
+            while state == _RUNNING:
+                p()
+                show_new_log()
+                state = set_status(task_status())
+        show_new_log()
+
+    def _task_status(self) -> Any:
+        changed = self._task.changed
+        fd = None
+        if changed is None and not self._fd_fired:
+            fd = self._completion_fd_fn()
+        if fd is None:
+            self._last_time = _delay(
+                self._last_time, self._cur_poll, self._time_end, changed
+            )
+        else:
+            # Once readable the descriptor usually stays readable, so
+            # waiting on it again would return immediately and we'd spin
+            # while the status catches up.  Sleep as normal from then on.
+            self._last_time, self._fd_fired = _delay_fd(
+                self._last_time, self._cur_poll, self._time_end, fd
+            )
+        self._increase_poll()
+        return self._status_fn()
+
+    def _show_new_log(self) -> None:
+        if self._show_log:
+            if self._log_unchanged(self._log_etag_fn()):
+                return
+            skip = self._skip
+            self._set_skip(_show_new_log(skip, self._log_fn(skip)))
+
+
+class _AsyncRunningTask(_RunningTaskBase):
+    def __init__(
+        self,
+        task: AsyncTask,
+        *,
+        show_log: bool = True,
+        progress: bool = True,
+        poll: float = 1,
+        poll_max: float | None = None,
+        backoff: float = 1,
+        timeout: float | None = None,
+    ):
+        super().__init__(
+            task,
+            show_log=show_log,
+            progress=progress,
+            poll=poll,
+            poll_max=poll_max,
+            backoff=backoff,
+            timeout=timeout,
+        )
+        self._task = task
+        self._status_fn: Callable[[], Awaitable[Any]] = task.status
+        self._log_fn = task.log_from
+        self._log_etag_fn = task.log_etag
+
+    async def wait(self) -> Result:
+        self._last_time = time.monotonic()
+        self._set_status(await self._status_fn())
+        if self._state == _FINISHED:
+            await self._show_new_log()
+            return self._result()
+        await self._wait_to_start()
+        await self._wait_to_finish()
+        return self._result()
+
+    async def _wait_to_start(self) -> None:
+        display = self._show_log or self._progress
+        set_status = self._set_status
+        task_status = self._task_status
+        state = self._state
+        with _very_simple_progress("Waiting", display=display) as p:
+            while state == _WAITING:
+                p()
+                state = set_status(await task_status())
+
+    async def _wait_to_finish(self) -> None:
+        set_status = self._set_status
+        task_status = self._task_status
+        show_new_log = self._show_new_log
+        state = self._state
+        with _very_simple_progress("Running", display=self._progress) as p:
+            while state == _RUNNING:
+                p()
+                await show_new_log()
+                state = set_status(await task_status())
+        await show_new_log()
+
+    async def _task_status(self) -> Any:
+        self._last_time = await _adelay(
+            self._last_time, self._cur_poll, self._time_end
+        )
+        self._increase_poll()
+        return await self._status_fn()
+
+    async def _show_new_log(self) -> None:
+        if self._show_log:
+            if self._log_unchanged(await self._log_etag_fn()):
+                return
+            skip = self._skip
+            self._set_skip(_show_new_log(skip, await self._log_fn(skip)))
+
+
+def taskwait(
+    task: Task,
+    *,
+    show_log: bool = True,
+    progress: bool = True,
+    poll: float = 1,
+    poll_max: float | None = None,
+    backoff: float = 1,
+    timeout: float | None = None,
+) -> Result:
+    """
+    Wait for a task to complete.
+
+    Args:
+      task (Task): The task to wait on.
+      show_log (bool): Show logs, if available, while waiting?
+      progress (bool): Show a progress bar while waiting? Only shown
+        while running if `show_log` is `False`.
+      poll (float): Period to poll for new status/logs, in seconds.
+      poll_max (float | None): Longest period to poll at, in seconds,
+        when `backoff` is greater than 1.  If `None`, the period is
+        not capped.
+      backoff (float): Factor to lengthen the polling period by
+        after each poll.  The period returns to `poll` whenever the
+        status changes or new logs arrive.  The default of 1 polls at
+        a constant rate.
+      timeout: (float | None): Time, in seconds, to wait before
+        throwing a `TimeoutError`.  If `None`, we wait forever.
+
+    """
+    t = _RunningTask(
+        task,
+        show_log=show_log,
+        progress=progress,
+        poll=poll,
+        poll_max=poll_max,
+        backoff=backoff,
+        timeout=timeout,
+    )
+    return t.wait()
+
+
+def taskwait_many(
+    tasks: list[Task],
+    *,
+    poll: float = 1,
+    timeout: float | None = None,
+    parallel: bool = False,
+) -> list[Result]:
+    """
+    Wait for several tasks to complete.
+
+    All tasks are polled in turn within a single loop, sleeping once
+    per round rather than once per task.  Logs and progress are not
+    shown.
+
+    Unlike `taskwait`, this always sleeps for the fixed `poll` period
+    between rounds: the `Task.changed` and `Task.completion_fd` hooks
+    are not used, and there is no backoff.
+
+    Args:
+      tasks (list[Task]): The tasks to wait on.
+      poll (float): Period to poll for new status, in seconds.
+      timeout: (float | None): Time, in seconds, to wait before
+        throwing a `TimeoutError`.  If `None`, we wait forever.
+      parallel (bool): Query the statuses of tasks concurrently, from
+        a pool of threads?  Useful where `status()` is slow because it
+        waits on I/O.
+
+    Returns:
+      A list of `Result`, in the same order as `tasks`.
+
+    """
+    if not tasks:
+        return []
+    pending = [
+        (i, _RunningTask(t, show_log=False, progress=False))
+        for i, t in enumerate(tasks)
+    ]
+    results: dict[int, Result] = {}
+    end = None if timeout is None else time.monotonic() + timeout
+    prev: float | None = None
+    with ExitStack() as stack:
+        query: Callable[..., Iterable[Any]] = map
+        if parallel:
+            pool = stack.enter_context(ThreadPoolExecutor(len(tasks)))
+            query = pool.map
+        while pending:
+            prev = _delay(prev, poll, end)
+            status = query(lambda x: x[1]._status_fn(), pending)
+            remaining = []
+            for (i, t), s in zip(pending, status, strict=True):
+                if t._set_status(s) == _FINISHED:
+                    results[i] = t._result()
+                else:
+                    remaining.append((i, t))
+            pending = remaining
+    return [results[i] for i in range(len(tasks))]
+
+
+async def taskwait_async(
+    task: AsyncTask,
+    *,
+    show_log: bool = True,
+    progress: bool = True,
+    poll: float = 1,
+    poll_max: float | None = None,
+    backoff: float = 1,
+    timeout: float | None = None,
+) -> Result:
+    """
+    Wait for a task to complete, without blocking the event loop.
+
+    This is the asynchronous counterpart to `taskwait`; use it to wait
+    on many tasks concurrently from a single thread.
+
+    Args:
+      task (AsyncTask): The task to wait on.
+      show_log (bool): Show logs, if available, while waiting?
+      progress (bool): Show a progress bar while waiting? Only shown
+        while running if `show_log` is `False`.
+      poll (float): Period to poll for new status/logs, in seconds.
+      poll_max (float | None): Longest period to poll at, in seconds,
+        when `backoff` is greater than 1.  If `None`, the period is
+        not capped.
+      backoff (float): Factor to lengthen the polling period by
+        after each poll.  The period returns to `poll` whenever the
+        status changes or new logs arrive.  The default of 1 polls at
+        a constant rate.
+      timeout: (float | None): Time, in seconds, to wait before
+        throwing a `TimeoutError`.  If `None`, we wait forever.
+
+    """
+    t = _AsyncRunningTask(
+        task,
+        show_log=show_log,
+        progress=progress,
+        poll=poll,
+        poll_max=poll_max,
+        backoff=backoff,
+        timeout=timeout,
+    )
+    return await t.wait()
+
+
+def _delay(
+    prev: float | None,
+    poll: float,
+    end: float | None,
+    changed: threading.Event | None = None,
+) -> float:
+    now = time.monotonic()
+    if prev is None:
+        return now
+    wait = _wait_time(prev, now, poll, end)
+    if changed is not None:
+        changed.wait(max(0, wait))
+        changed.clear()
+    elif wait <= 0:
+        return now
+    else:
+        time.sleep(wait)
+    # The next period runs from when this poll actually happens, after
+    # the wait, not from when we were called.
+    return time.monotonic()
+
+
+def _delay_fd(
+    prev: float | None, poll: float, end: float | None, fd: int
+) -> tuple[float, bool]:
+    # As for _delay, but waiting for fd to become readable rather than
+    # sleeping, and also reporting whether it did.
+    now = time.monotonic()
+    if prev is None:
+        return now, False
+    wait = _wait_time(prev, now, poll, end)
+    with selectors.DefaultSelector() as sel:
+        sel.register(fd, selectors.EVENT_READ)
+        ready = bool(sel.select(max(0, wait)))
+    return time.monotonic(), ready
+
+
+async def _adelay(prev: float | None, poll: float, end: float | None) -> float:
+    now = time.monotonic()
+    if prev is None:
+        return now
+    wait = _wait_time(prev, now, poll, end)
+    if wait <= 0:
+        return now
+    await asyncio.sleep(wait)
+    return time.monotonic()
+
+
+def _wait_time(
+    prev: float, now: float, poll: float, end: float | None
+) -> float:
+    if end is not None and now > end:
+        raise TimeoutError()
+    return poll - (now - prev)
+
+
+def _intern(status: Any) -> Any:
+    # Only used on the status sets.  sys.intern only accepts exact str,
+    # not subclasses such as the members of a str-based Enum; those are
+    # left as they are.
+    return sys.intern(status) if type(status) is str else status
+
+
+def _show_new_log(skip: int, value: list[str] | None) -> int:
+    if not value:
+        return skip
+    sys.stdout.write("\n".join(value) + "\n")
+    return skip + len(value)
+
+
+# Small stub that we'll swap in for something better later.
+@contextmanager
+def _very_simple_progress(
+    start: str, end: str = "OK", *, display: bool = True
+) -> Iterator[Callable[[], Any]]:
+    if not display:
+        yield _noop
+        return
+
+    stdout = sys.stdout
+    if not stdout.isatty():
+        # Nobody is watching the dots arrive on a pipe or file, so just
+        # count them and write the whole line once we're done.
+        dots = itertools.count()
+        try:
+            yield functools.partial(next, dots)
+        finally:
+            stdout.write(start + "." * next(dots) + end + "\n")
+            stdout.flush()
+        return
+
+    stdout.write(start)
+    stdout.flush()
+
+    def fn() -> None:
+        stdout.write(".")
+        stdout.flush()
+
+    try:
+        yield fn
+    finally:
+        print(end, flush=True)
+
+
+def _noop() -> None:
+    pass
@@ -1,10 +1,24 @@
-import math
+import asyncio
+import itertools
+import selectors
+import socket
+import sys
+import threading
 import time
+from enum import Enum
 from unittest import mock
 
 import pytest
 
-from taskwait import Result, Task, _delay, _show_new_log, taskwait
+from taskwait import (
+    AsyncTask,
+    Result,
+    Task,
+    taskwait,
+    taskwait_async,
+    taskwait_many,
+)
+from taskwait._wait import _delay, _delay_fd, _show_new_log
 
 
 class ExampleTask(Task):
@@ -27,11 +41,85 @@ class ExampleTask(Task):
         return self.show_logs
 
 
+class ExampleAsyncTask(AsyncTask):
+    def __init__(self, plan, *, show_logs: bool = False):
+        self.task = ExampleTask(plan, show_logs=show_logs)
+        self.status_waiting = self.task.status_waiting
+        self.status_running = self.task.status_running
+
+    async def status(self):
+        return self.task.status()
+
+    async def log(self) -> list[str]:
+        return self.task.log()
+
+    def has_log(self) -> bool:
+        return self.task.has_log()
+
+
 def test_can_wait_for_task():
     task = ExampleTask(["created", "submitted", "running", "finishing", "done"])
     result = taskwait(task, poll=0)
     assert isinstance(result, Result)
     assert result.status == "done"
+    with pytest.raises(AttributeError):
+        result.status = "running"  # type: ignore[misc]
+
+
+def test_can_wait_for_task_with_dynamic_statuses():
+    # Statuses built at runtime are not the same objects as those in
+    # the status sets, nor as each other.
+    plan = ["".join(["run", "ning"]) for _ in range(3)] + ["done"]
+    assert plan[0] is not plan[1]
+    task = ExampleTask(plan)
+    result = taskwait(task, poll=0, progress=False)
+    assert result.status == "done"
+    assert task.plan == []
+
+
+def test_can_wait_for_task_with_empty_status():
+    task = ExampleTask(["", "", "done"])
+    task.status_waiting = {""}
+    result = taskwait(task, poll=0, progress=False)
+    assert result.status == "done"
+    assert task.plan == []
+
+
+def test_can_wait_for_task_with_enum_statuses():
+    class Status(str, Enum):
+        CREATED = "created"
+        RUNNING = "running"
+        DONE = "done"
+
+    task = ExampleTask(
+        [Status.CREATED, Status.RUNNING, Status.RUNNING, Status.DONE]
+    )
+    task.status_waiting = {Status.CREATED}
+    task.status_running = {Status.RUNNING}
+    result = taskwait(task, poll=0, progress=False)
+    assert result.status is Status.DONE
+    assert task.plan == []
+
+
+def test_can_wait_for_task_with_non_string_statuses():
+    # Not what the type hints ask for, but accepted all the same, by
+    # both the pure Python and compiled builds.
+    def make_task():
+        task = ExampleTask([0, 1, 1, 2])
+        task.status_waiting = {0}
+        task.status_running = {1}
+        return task
+
+    assert taskwait(make_task(), poll=0, progress=False).status == 2
+    assert taskwait_many([make_task()], poll=0)[0].status == 2
+
+    async_task = ExampleAsyncTask([])
+    async_task.task = make_task()
+    async_task.status_waiting = async_task.task.status_waiting
+    async_task.status_running = async_task.task.status_running
+    result = asyncio.run(taskwait_async(async_task, poll=0, progress=False))
+    assert result.status == 2
+    assert async_task.task.plan == []
 
 
 def test_can_print_logs(capsys):
@@ -46,9 +134,162 @@ def test_can_print_logs(capsys):
     )
 
 
+def test_can_show_progress(capsys):
+    task = ExampleTask(["created", "running", "running", "done"])
+    taskwait(task, poll=0)
+    assert capsys.readouterr().out == "Waiting.OK\nRunning..OK\n"
+
+    task = ExampleTask(["created", "running", "running", "done"])
+    taskwait(task, poll=0, progress=False)
+    assert capsys.readouterr().out == ""
+
+
+def test_can_show_progress_on_terminal(capsys, mocker):
+    mocker.patch.object(sys.stdout, "isatty", return_value=True)
+    mock_write = mocker.spy(sys.stdout, "write")
+    task = ExampleTask(["created", "running", "running", "done"])
+    taskwait(task, poll=0)
+    assert capsys.readouterr().out == "Waiting.OK\nRunning..OK\n"
+    assert mock.call(".") in mock_write.mock_calls
+
+
+def test_checks_status_before_sleeping(mocker):
+    mock_sleep = mocker.patch("time.sleep")
+    task = ExampleTask(["done"])
+    taskwait(task, poll=10)
+    assert mock_sleep.call_count == 0
+
+    task = ExampleTask(["created", "running", "done"])
+    taskwait(task, poll=10, progress=False)
+    assert task.plan == []
+    assert mock_sleep.call_count == 2
+
+
+def test_polls_at_regular_intervals():
+    class TimedTask(ExampleTask):
+        def status(self):
+            self.times.append(time.monotonic())
+            return super().status()
+
+    plan = ["created", "created", "running", "running", "done"]
+    task = TimedTask(plan)
+    task.times = []
+    taskwait(task, poll=0.05, progress=False)
+    gaps = [b - a for a, b in itertools.pairwise(task.times)]
+    assert len(gaps) == 4
+    assert min(gaps) >= 0.04
+
+    async_task = ExampleAsyncTask([])
+    async_task.task = TimedTask(plan)
+    async_task.task.times = []
+    asyncio.run(taskwait_async(async_task, poll=0.05, progress=False))
+    gaps = [b - a for a, b in itertools.pairwise(async_task.task.times)]
+    assert len(gaps) == 4
+    assert min(gaps) >= 0.04
+
+
+def test_can_back_off_polling(mocker):
+    # A fake clock that only moves forward when we sleep
+    clock = [0.0]
+
+    def sleep(wait):
+        clock[0] += wait
+
+    mocker.patch("time.monotonic", side_effect=lambda: clock[0])
+    mocker.patch("time.sleep", side_effect=sleep)
+
+    class TimedTask(ExampleTask):
+        def status(self):
+            self.times.append(clock[0])
+            return super().status()
+
+    # Statuses built at runtime, so that repeats are equal but not
+    # identical; that must not count as a change of status.
+    plan = ["created", "created", "created", "running", "running", "done"]
+    task = TimedTask(["".join(list(x)) for x in plan])
+    task.times = []
+    result = taskwait(task, poll=1, poll_max=3, backoff=2, progress=False)
+    assert result.status == "done"
+    gaps = [b - a for a, b in itertools.pairwise(task.times)]
+    assert gaps == [1, 2, 3, 1, 2]
+
+
+def test_skips_fetching_unchanged_logs(capsys):
+    class EtagTask(ExampleTask):
+        def log_etag(self):
+            return self.etags.pop()
+
+    task = EtagTask(["running", "running", "running", "done"], show_logs=True)
+    task.etags = [2, 1, 1, 1]
+    taskwait(task, poll=0)
+    assert task.logs == ["Log entry 1", "Log entry 2"]
+    assert capsys.readouterr().out == "WaitingOK\nLog entry 1\nLog entry 2\n"
+
+
+def test_can_wait_for_async_task(capsys):
+    task = ExampleAsyncTask(
+        ["created", "submitted", "running", "finishing", "done"], show_logs=True
+    )
+    result = asyncio.run(taskwait_async(task, poll=0))
+    assert isinstance(result, Result)
+    assert result.status == "done"
+    out = capsys.readouterr().out
+    assert out == (
+        "Waiting..OK\n" + "".join([f"Log entry {i + 1}\n" for i in range(3)])
+    )
+
+
+def test_can_wait_for_async_tasks_concurrently():
+    plan = ["created", "running", "done"]
+    tasks = [ExampleAsyncTask(plan) for _ in range(3)]
+
+    async def wait_all():
+        return await asyncio.gather(
+            *(taskwait_async(t, poll=0, progress=False) for t in tasks)
+        )
+
+    results = asyncio.run(wait_all())
+    assert [r.status for r in results] == ["done"] * 3
+
+
+def test_can_wait_for_finished_task(capsys):
+    task = ExampleTask(["done"], show_logs=True)
+    result = taskwait(task, poll=0)
+    assert result.status == "done"
+    assert capsys.readouterr().out == "Log entry 1\n"
+
+    task = ExampleTask(["done"])
+    result = taskwait(task, poll=0)
+    assert result.status == "done"
+    assert capsys.readouterr().out == ""
+
+    result = asyncio.run(taskwait_async(ExampleAsyncTask(["done"]), poll=0))
+    assert result.status == "done"
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_can_wait_for_many_tasks(parallel):
+    tasks = [
+        ExampleTask(["created", "running", "running", "failed"]),
+        ExampleTask(["done"]),
+        ExampleTask(["created", "running", "done"]),
+    ]
+    results = taskwait_many(tasks, poll=0, parallel=parallel)
+    assert [r.status for r in results] == ["failed", "done", "done"]
+    assert all(t.plan == [] for t in tasks)
+    assert taskwait_many([]) == []
+
+
+def test_can_timeout_waiting_for_many_tasks():
+    tasks = [ExampleTask(["created"] * 100)]
+    with pytest.raises(TimeoutError):
+        taskwait_many(tasks, poll=0, timeout=0)
+
+
 def test_can_timeout():
-    prev = time.time() - 100
-    end = time.time() - 1
+    prev = time.monotonic() - 100
+    end = time.monotonic() - 1
     with pytest.raises(TimeoutError):
         _delay(prev, 0, end)
 
@@ -56,10 +297,10 @@ def test_can_timeout():
 def test_delay_if_required(mocker):
     t = 1000000
     poll = 10
-    end = math.inf
+    end = None
     mock_sleep = mock.MagicMock()
     mock_time = mock.MagicMock(return_value=t)
-    mocker.patch("time.time", mock_time)
+    mocker.patch("time.monotonic", mock_time)
     mocker.patch("time.sleep", mock_sleep)
 
     # We don't call sleep if we've never called the function before:
@@ -72,17 +313,146 @@ def test_delay_if_required(mocker):
     assert mock_time.call_count == 2
     assert mock_sleep.call_count == 0
 
-    # We don't call sleep if we waited more than poll seconds since last time
+    # We do call sleep if we waited less than poll seconds since last
+    # time, and read the clock again afterwards
     assert _delay(t - 3, poll, end) == t
-    assert mock_time.call_count == 3
+    assert mock_time.call_count == 4
     assert mock_sleep.call_count == 1
     assert mock_sleep.mock_calls[0] == mock.call(7)
 
 
+def test_delay_waits_on_changed_event(mocker):
+    t = 1000000
+    poll = 10
+    end = None
+    mock_sleep = mock.MagicMock()
+    mocker.patch("time.monotonic", mock.MagicMock(return_value=t))
+    mocker.patch("time.sleep", mock_sleep)
+
+    # If the event has been set we return straight away, and clear it
+    changed = threading.Event()
+    changed.set()
+    assert _delay(t - 3, poll, end, changed) == t
+    assert mock_sleep.call_count == 0
+    assert not changed.is_set()
+
+    # Otherwise we wait on the event for the remainder of the period
+    changed = threading.Event()
+    mock_wait = mocker.patch.object(changed, "wait", return_value=False)
+    mock_clear = mocker.patch.object(changed, "clear", return_value=None)
+    assert _delay(t - 3, poll, end, changed) == t
+    assert mock_sleep.call_count == 0
+    assert mock_wait.mock_calls == [mock.call(7)]
+    assert mock_clear.call_count == 1
+
+
+def test_wakes_when_task_signals_change():
+    class EventTask(ExampleTask):
+        def __init__(self):
+            super().__init__([])
+            self.changed = threading.Event()
+            self.finished = False
+
+        def status(self):
+            return "done" if self.finished else "running"
+
+    task = EventTask()
+
+    def finish():
+        time.sleep(0.2)
+        task.finished = True
+        task.changed.set()
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    t0 = time.monotonic()
+    result = taskwait(task, poll=5, progress=False)
+    elapsed = time.monotonic() - t0
+    thread.join()
+    assert result.status == "done"
+    assert elapsed < 2
+
+
+def test_delay_waits_on_completion_fd(mocker):
+    t = 1000000
+    poll = 10
+    mock_sleep = mock.MagicMock()
+    mocker.patch("time.monotonic", mock.MagicMock(return_value=t))
+    mocker.patch("time.sleep", mock_sleep)
+
+    r, w = socket.socketpair()
+    with r, w:
+        # Not readable, so we wait out the remainder of the period
+        assert _delay_fd(t - 9.99, poll, None, r.fileno()) == (t, False)
+        # Readable, so we return immediately
+        w.send(b"x")
+        assert _delay_fd(t - 3, poll, None, r.fileno()) == (t, True)
+    assert mock_sleep.call_count == 0
+
+
+def test_sleeps_once_completion_fd_has_fired(mocker):
+    class FdTask(ExampleTask):
+        def completion_fd(self):
+            self.fd_calls += 1
+            return self.fd
+
+    r, w = socket.socketpair()
+    with r, w:
+        # The fd has fired, but the status takes a few polls to catch up
+        w.send(b"x")
+        task = FdTask(["running"] * 6 + ["done"])
+        task.fd = r.fileno()
+        task.fd_calls = 0
+        spy_selector = mocker.spy(selectors, "DefaultSelector")
+        t0 = time.monotonic()
+        result = taskwait(task, poll=0.05, progress=False)
+        elapsed = time.monotonic() - t0
+    assert result.status == "done"
+    assert task.fd_calls == 1
+    assert spy_selector.call_count == 1
+    assert elapsed >= 0.2
+
+
+def test_ignores_completion_fd_when_task_has_changed_event():
+    class FdTask(ExampleTask):
+        def completion_fd(self):
+            raise NotImplementedError()
+
+    task = FdTask(["running", "running", "done"])
+    task.changed = threading.Event()
+    result = taskwait(task, poll=0, progress=False)
+    assert result.status == "done"
+
+
 def test_can_tail_logs(capsys):
     assert _show_new_log(0, None) == 0
-    assert _show_new_log(0, []) == 0
-    assert _show_new_log(3, ["a", "b", "c"]) == 3
+    assert _show_new_log(3, []) == 3
     assert capsys.readouterr().out == ""
-    assert _show_new_log(1, ["a", "b", "c"]) == 3
+    assert _show_new_log(1, ["b", "c"]) == 3
     assert capsys.readouterr().out == "b\nc\n"
+
+
+def test_log_from_defaults_to_slicing_log():
+    task = ExampleTask([])
+    assert task.log_from(0) == ["Log entry 1"]
+    assert task.log_from(1) == ["Log entry 2"]
+    assert task.log_from(5) == []
+
+
+def test_can_fetch_only_new_logs(capsys):
+    class IncrementalTask(ExampleTask):
+        def log(self):
+            raise NotImplementedError()
+
+        def log_from(self, skip):
+            self.skips.append(skip)
+            return [f"Log entry {skip + 1}"]
+
+    task = IncrementalTask(["running", "running", "done"], show_logs=True)
+    task.skips = []
+    result = taskwait(task, poll=0)
+    assert result.status == "done"
+    assert task.skips == [0, 1, 2]
+    assert capsys.readouterr().out == (
+        "WaitingOK\n" + "".join([f"Log entry {i + 1}\n" for i in range(3)])
+    )